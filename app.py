@@ -1,10 +1,10 @@
 import streamlit as st
 import sqlite3
-from datetime import datetime, date
-import pytz
+from datetime import datetime, date, timedelta, timezone
 
 # ===== タイムゾーン（日本時間） =====
-JST = pytz.timezone("Asia/Tokyo")
+# 日本には夏時間がないので固定オフセットで十分（pytz より軽い）
+JST = timezone(timedelta(hours=9))
 
 # ===== 気分リスト（絵文字付き表示用） =====
 MOOD_OPTIONS = [
@@ -17,224 +17,522 @@ MOOD_OPTIONS = [
 ]
 
 MOOD_LABELS = [f"{emoji} {text}" for (text, emoji) in MOOD_OPTIONS]
-MOOD_TO_EMOJI = {text: emoji for (text, emoji) in MOOD_OPTIONS}
+# 履歴一覧に出す気分ラベル（気分テキスト → 表示用ラベル）
+MOOD_RENDER = {
+    text: f"{emoji} 気分記録なし" if text == "なし" else f"{emoji} {text}"
+    for (text, emoji) in MOOD_OPTIONS
+}
 LABEL_TO_MOOD = {label: text for (text, emoji), label in zip(MOOD_OPTIONS, MOOD_LABELS)}
 
+# ポイント履歴の 1 ページあたりの件数
+HISTORY_PAGE_SIZE = 50
+
 
 # ===== DB 接続まわり =====
+CONNECTION_PRAGMAS_SQL = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-20000;     -- 約 20MB
+PRAGMA mmap_size=134217728;   -- 128MB
+"""
+
+
 @st.cache_resource
 def get_connection():
     # Streamlit Cloud でもローカルでも同じファイル名を使う
-    conn = sqlite3.connect("diary_points.db", check_same_thread=False)
+    # 同じ SQL 文字列はコンパイル済み statement を使い回す（既定値を明示）
+    conn = sqlite3.connect(
+        "diary_points.db", check_same_thread=False, cached_statements=128
+    )
+    # 行は sqlite3.Row で受け取り、列名でアクセスできるようにする
+    conn.row_factory = sqlite3.Row
+    # 書き込みのたびに fsync しないよう WAL + synchronous=NORMAL にする
+    conn.executescript(CONNECTION_PRAGMAS_SQL)
+    # テーブル準備はプロセスごとに 1 回だけ（rerun のたびに DDL を流さない）
+    init_db(conn)
     return conn
 
 
-def init_db(conn):
-    cur = conn.cursor()
+# 読み取り専用の接続（WAL なので書き込み中でも待たされない）
+READ_CONNECTION_PRAGMAS_SQL = """
+PRAGMA query_only=1;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-20000;     -- 約 20MB
+PRAGMA mmap_size=134217728;   -- 128MB
+"""
 
-    # 日記テーブル
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS diary_entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            entry_date TEXT NOT NULL,
-            entry_time TEXT,
-            mood TEXT,
-            content TEXT,
-            created_at TEXT NOT NULL
-        )
-        """
-    )
 
-    # タスクテーブル（ポイントを貯める用）
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            point_value INTEGER NOT NULL,
-            is_active INTEGER NOT NULL DEFAULT 1
-        )
-        """
+@st.cache_resource
+def get_read_connection():
+    # ファイル作成・テーブル準備は書き込み用の接続で先に済ませておく
+    get_connection()
+    conn = sqlite3.connect(
+        "file:diary_points.db?mode=ro",
+        uri=True,
+        check_same_thread=False,
+        cached_statements=128,
     )
+    conn.row_factory = sqlite3.Row
+    conn.executescript(READ_CONNECTION_PRAGMAS_SQL)
+    return conn
+
+
+# ===== スキーマ（CREATE はまとめて 1 本のスクリプトで流す） =====
+# BEGIN / COMMIT は init_db() 側で付ける（points_log の作り直しも同じトランザクションに入れるため）
+SCHEMA_SQL = """
+-- 日記テーブル
+CREATE TABLE IF NOT EXISTS diary_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_date TEXT NOT NULL,
+    entry_time TEXT,
+    mood TEXT,
+    content TEXT,
+    created_at TEXT NOT NULL,        -- 表示用（ISO 文字列）
+    created_at_i INTEGER,            -- 並べ替え用（UNIX 秒）
+    snippet TEXT                     -- 一覧用の本文先頭 20 文字（保存時に作成）
+);
+
+-- タスクテーブル（ポイントを貯める用）
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    point_value INTEGER NOT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1
+);
+
+-- ポイント履歴テーブル（貯める＆使う両方）
+CREATE TABLE IF NOT EXISTS points_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    action_type TEXT NOT NULL,       -- "earn" or "spend"
+    task_or_reason TEXT NOT NULL,    -- 何の項目か
+    points INTEGER NOT NULL,         -- 加算はプラス、消費はマイナス
+    note TEXT,                       -- コメント / メモ
+    created_at TEXT NOT NULL
+);
+
+-- 合計ポイントを持っておくテーブル（毎回 SUM しないため）
+CREATE TABLE IF NOT EXISTS kv_state (
+    k TEXT PRIMARY KEY,
+    v INTEGER NOT NULL
+);
+
+-- points_log に行が入ったら合計も同じトランザクション内で更新する
+CREATE TRIGGER IF NOT EXISTS trg_points_log_ins AFTER INSERT ON points_log
+BEGIN
+    UPDATE kv_state SET v = v + NEW.points WHERE k = 'total';
+END;
+
+-- 新しい順に LIMIT 件だけ読むためのインデックス
+-- （日記は整数の created_at_i で並べる。
+--   points_log の created_at は JST 固定の ISO 文字列なので、文字列順 = 時刻順）
+DROP INDEX IF EXISTS idx_diary_created;
+CREATE INDEX IF NOT EXISTS idx_diary_created_i ON diary_entries(created_at_i DESC);
+CREATE INDEX IF NOT EXISTS idx_points_created ON points_log(created_at DESC);
+
+-- 有効なタスクだけを id 順に読むためのインデックス
+CREATE INDEX IF NOT EXISTS idx_tasks_active ON tasks(is_active);
+
+-- 統計情報を取り直して、プランナーが上のインデックスを選べるようにする
+ANALYZE;
+"""
+
+# 古い形式の points_log を消して、スキーマ作成のあとに合計もリセットする
+DROP_OLD_POINTS_LOG_SQL = """
+DROP TABLE points_log;
+"""
+RESET_TOTAL_POINTS_SQL = """
+DELETE FROM kv_state WHERE k = 'total';
+"""
+
+
+def init_db(conn):
+    cur = conn.cursor()
 
-        # ポイント履歴テーブル（貯める＆使う両方）
     # 既に古い形式の points_log がある場合は、一度削除して作り直す
-    cur.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name='points_log'"
-    )
-    exists = cur.fetchone()
-
-    if exists:
-        # いまの points_log のカラム構成を確認
-        cur.execute("PRAGMA table_info(points_log)")
-        cols = [row[1] for row in cur.fetchall()]
-        expected_cols = [
-            "id",
-            "action_type",
-            "task_or_reason",
-            "points",
-            "note",
-            "created_at",
-        ]
-
-        # 想定と違う = 古いテーブル定義なので作り直す
-        if cols != expected_cols:
-            cur.execute("DROP TABLE points_log")
-            exists = None
-
-    # テーブルがまだ無い場合だけ、新しい形で作成
-    if not exists:
+    cur.execute("PRAGMA table_info(points_log)")
+    cols = [row[1] for row in cur.fetchall()]
+    expected_cols = [
+        "id",
+        "action_type",
+        "task_or_reason",
+        "points",
+        "note",
+        "created_at",
+    ]
+    # 想定と違う = 古いテーブル定義なので作り直す（テーブルが無いときは cols が空）
+    rebuild_points_log = bool(cols) and cols != expected_cols
+
+    # 古い diary_entries には created_at_i が無いので追加しておく
+    # （中身は下のトランザクションで埋める）
+    cur.execute("PRAGMA table_info(diary_entries)")
+    diary_cols = [row[1] for row in cur.fetchall()]
+    if diary_cols and "created_at_i" not in diary_cols:
+        cur.execute("ALTER TABLE diary_entries ADD COLUMN created_at_i INTEGER")
+    # snippet も同様
+    if diary_cols and "snippet" not in diary_cols:
+        cur.execute("ALTER TABLE diary_entries ADD COLUMN snippet TEXT")
+
+    # 削除・作り直し・合計のリセットは 1 トランザクションで行う
+    # （途中で落ちても、古い合計だけが残ることはない）
+    schema_sql = SCHEMA_SQL
+    if rebuild_points_log:
+        schema_sql = DROP_OLD_POINTS_LOG_SQL + SCHEMA_SQL + RESET_TOTAL_POINTS_SQL
+    conn.executescript("BEGIN;\n" + schema_sql + "COMMIT;\n")
+
+    # 残りの初期データはまとめて 1 トランザクションで入れる
+    with conn:
+        # 初回（または合計をリセットした直後）は既存の履歴から合計を計算して入れておく
         cur.execute(
             """
-            CREATE TABLE points_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                action_type TEXT NOT NULL,       -- "earn" or "spend"
-                task_or_reason TEXT NOT NULL,    -- 何の項目か
-                points INTEGER NOT NULL,         -- 加算はプラス、消費はマイナス
-                note TEXT,                       -- コメント / メモ
-                created_at TEXT NOT NULL
-            )
+            INSERT OR IGNORE INTO kv_state (k, v)
+            SELECT 'total', COALESCE(SUM(points), 0) FROM points_log
+            """
+        )
+
+        # デフォルトタスクを少しだけ入れておく（空のときだけ）
+        cur.execute("SELECT EXISTS(SELECT 1 FROM tasks)")
+        if not cur.fetchone()[0]:
+            default_tasks = [
+                ("日記を書いた", 1),
+                ("Python の勉強", 3),
+                ("運動した", 3),
+                ("早起きできた", 2),
+            ]
+            cur.executemany(INSERT_TASK_SQL, default_tasks)
+
+        # created_at_i が未設定の行を created_at から埋める
+        # （途中で落ちても次回の起動で残りを埋め直せるよう、毎回 NULL の行だけ見る）
+        cur.execute(
+            """
+            UPDATE diary_entries
+            SET created_at_i = CAST(strftime('%s', created_at) AS INTEGER)
+            WHERE created_at_i IS NULL
             """
         )
 
-    # デフォルトタスクを少しだけ入れておく（空のときだけ）
-    cur.execute("SELECT COUNT(*) FROM tasks")
-    if cur.fetchone()[0] == 0:
-        default_tasks = [
-            ("日記を書いた", 1),
-            ("Python の勉強", 3),
-            ("運動した", 3),
-            ("早起きできた", 2),
-        ]
+        # snippet も同様に、未設定の行を save_diary と同じ _diary_snippet で埋める
+        cur.execute("SELECT id, content FROM diary_entries WHERE snippet IS NULL")
         cur.executemany(
-            "INSERT INTO tasks (name, point_value, is_active) VALUES (?, ?, 1)",
-            default_tasks,
+            "UPDATE diary_entries SET snippet = ? WHERE id = ?",
+            [
+                (_diary_snippet(content), diary_id)
+                for (diary_id, content) in cur.fetchall()
+            ],
         )
 
-    conn.commit()
+
+# ===== SQL（文字列を固定して SQLite の statement cache に乗せる） =====
+INSERT_DIARY_SQL = """
+    INSERT INTO diary_entries
+        (entry_date, entry_time, mood, content, created_at, created_at_i, snippet)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# 一覧のタイトル用に、時刻ラベルは SQL 側で切り出す
+# （本文の先頭 20 文字は保存時に snippet カラムへ入れてある）
+# （本文そのものは開いたときに SELECT_DIARY_CONTENT_SQL で読む）
+SELECT_RECENT_DIARIES_SQL = """
+    SELECT
+        id,
+        entry_date,
+        COALESCE(substr(entry_time, 1, 5), substr(created_at, 12, 5), '') AS time_label,
+        mood,
+        snippet,
+        created_at
+    FROM diary_entries
+    ORDER BY created_at_i DESC
+    LIMIT ?
+"""
+
+SELECT_DIARY_CONTENT_SQL = "SELECT content FROM diary_entries WHERE id = ?"
+
+INSERT_POINTS_SQL = """
+    INSERT INTO points_log (action_type, task_or_reason, points, note, created_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+SELECT_TOTAL_POINTS_SQL = "SELECT v FROM kv_state WHERE k = 'total'"
+
+SELECT_POINTS_HISTORY_SQL = """
+    SELECT action_type, task_or_reason, points, note, created_at
+    FROM points_log
+    ORDER BY created_at DESC
+    LIMIT ? OFFSET ?
+"""
+
+SELECT_ACTIVE_TASKS_SQL = """
+    SELECT id, name, point_value
+    FROM tasks
+    WHERE is_active = 1
+    ORDER BY id
+"""
+
+SELECT_ALL_TASKS_SQL = """
+    SELECT id, name, point_value, is_active
+    FROM tasks
+    ORDER BY id
+"""
+
+INSERT_TASK_SQL = "INSERT INTO tasks (name, point_value, is_active) VALUES (?, ?, 1)"
+
+UPDATE_TASK_ACTIVE_SQL = "UPDATE tasks SET is_active = ? WHERE id = ?"
 
 
 # ===== 日記関連の関数 =====
+def _diary_snippet(content):
+    """一覧のタイトル用の本文先頭 20 文字（改行は空白にして前後の空白を除く）"""
+    return (content or "").replace("\n", " ").strip()[:20]
+
+
 def save_diary(conn, entry_date: date, entry_time, mood: str, content: str):
-    now_jst = datetime.now(JST).isoformat(timespec="seconds")
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO diary_entries (entry_date, entry_time, mood, content, created_at)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (
-            entry_date.isoformat(),
-            entry_time.strftime("%H:%M:%S") if entry_time else None,
-            mood,
-            content,
-            now_jst,
-        ),
-    )
-    conn.commit()
+    now = datetime.now(JST)
+    with conn:
+        conn.execute(
+            INSERT_DIARY_SQL,
+            (
+                entry_date.isoformat(),
+                entry_time.strftime("%H:%M:%S") if entry_time else None,
+                mood,
+                content,
+                now.isoformat(timespec="seconds"),
+                int(now.timestamp()),
+                # 一覧のタイトル用に本文先頭 20 文字を保存しておく
+                _diary_snippet(content),
+            ),
+        )
+    # 日記が増えたので、キャッシュ済みの一覧を捨てる
+    get_recent_diaries_cached.clear()
 
 
 def get_recent_diaries(conn, limit: int = 10):
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT entry_date, entry_time, mood, content, created_at
-        FROM diary_entries
-        ORDER BY datetime(created_at) DESC
-        LIMIT ?
-        """,
-        (limit,),
-    )
-    return cur.fetchall()
+    return conn.execute(SELECT_RECENT_DIARIES_SQL, (limit,)).fetchall()
+
+
+def get_diary_content(conn, diary_id: int):
+    row = conn.execute(SELECT_DIARY_CONTENT_SQL, (diary_id,)).fetchone()
+    return row["content"] if row else None
+
+
+@st.cache_data(ttl=300)
+def get_recent_diaries_cached(_conn, limit: int = 10):
+    """最近の日記（save_diary が呼ばれるまでは読み直さない）"""
+    diaries = []
+    for row in get_recent_diaries(_conn, limit):
+        # sqlite3.Row は pickle できないので dict にしてからキャッシュする
+        diary = dict(row)
+        # 一覧のタイトルもここで組み立てておく（rerun のたびに作り直さない）
+        # 時刻ラベル（"HH:MM"）は SQL で、本文先頭 20 文字は保存時に作成済み
+        mood_label = MOOD_RENDER.get(diary["mood"], diary["mood"])
+        title = f"{diary['entry_date']} {diary['time_label']} | {mood_label}"
+        if diary["snippet"]:
+            title += f" | {diary['snippet']}"
+        diary["title"] = title
+        diaries.append(diary)
+    return diaries
 
 
 # ===== ポイント関連の関数 =====
 def log_points(conn, action_type: str, task_or_reason: str, points: int, note: str):
     """ポイントの加算・消費を記録"""
     now_jst = datetime.now(JST).isoformat(timespec="seconds")
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO points_log (action_type, task_or_reason, points, note, created_at)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (action_type, task_or_reason, points, note, now_jst),
-    )
-    conn.commit()
+    # 合計（kv_state）はトリガーで更新される
+    with conn:
+        conn.execute(
+            INSERT_POINTS_SQL,
+            (action_type, task_or_reason, points, note, now_jst),
+        )
+    # 残高が変わったので、キャッシュ済みの合計を捨てる
+    get_total_points_cached.clear()
+
+
+def log_points_many(conn, entries):
+    """ポイントの加算・消費をまとめて記録（1 トランザクション・1 commit）
+
+    entries は (action_type, task_or_reason, points, note, created_at) のリスト。
+    created_at は記録した（キューに入れた）時点の日時で、保存時の日時ではない
+    """
+    with conn:
+        conn.executemany(INSERT_POINTS_SQL, entries)
+    get_total_points_cached.clear()
 
 
 def get_total_points(conn) -> int:
-    cur = conn.cursor()
-    cur.execute("SELECT COALESCE(SUM(points), 0) FROM points_log")
-    total = cur.fetchone()[0]
+    total = conn.execute(SELECT_TOTAL_POINTS_SQL).fetchone()[0]
     return total or 0
 
 
-def get_points_history(conn, limit: int | None = None):
-    cur = conn.cursor()
-    base_sql = """
-        SELECT action_type, task_or_reason, points, note, created_at
-        FROM points_log
-        ORDER BY datetime(created_at) DESC
-    """
-    if limit is not None:
-        base_sql += " LIMIT ?"
-        cur.execute(base_sql, (limit,))
-    else:
-        cur.execute(base_sql)
-    return cur.fetchall()
+# 書き込み時に clear() するのが基本。ttl は別プロセスからの書き込み対策の保険
+@st.cache_data(ttl=60)
+def get_total_points_cached(_conn) -> int:
+    """合計ポイント（log_points が呼ばれるまでは再集計しない）"""
+    return get_total_points(_conn)
+
+
+def get_points_history(conn, limit: int = 50, offset: int = 0):
+    return conn.execute(SELECT_POINTS_HISTORY_SQL, (limit, offset)).fetchall()
 
 
 def get_active_tasks(conn):
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, name, point_value
-        FROM tasks
-        WHERE is_active = 1
-        ORDER BY id
-        """
-    )
-    return cur.fetchall()
+    return conn.execute(SELECT_ACTIVE_TASKS_SQL).fetchall()
 
 
 def get_all_tasks(conn):
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, name, point_value, is_active
-        FROM tasks
-        ORDER BY id
-        """
-    )
-    return cur.fetchall()
+    return conn.execute(SELECT_ALL_TASKS_SQL).fetchall()
+
+
+@st.cache_data(ttl=300)
+def get_tasks_cached(_conn, only_active: bool):
+    """タスク一覧（add_task / update_tasks_active が呼ばれるまでは読み直さない）"""
+    rows = get_active_tasks(_conn) if only_active else get_all_tasks(_conn)
+    # sqlite3.Row は pickle できないので tuple にしてからキャッシュする
+    return [tuple(row) for row in rows]
 
 
 def add_task(conn, name: str, point_value: int):
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO tasks (name, point_value, is_active) VALUES (?, ?, 1)",
-        (name, point_value),
-    )
-    conn.commit()
+    with conn:
+        conn.execute(INSERT_TASK_SQL, (name, point_value))
+    get_tasks_cached.clear()
 
 
-def update_task_active(conn, task_id: int, is_active: bool):
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE tasks SET is_active = ? WHERE id = ?",
-        (1 if is_active else 0, task_id),
-    )
-    conn.commit()
+def update_tasks_active(conn, changes):
+    """タスクの有効 / 無効をまとめて更新（changes: (task_id, is_active) のリスト）"""
+    with conn:
+        conn.executemany(
+            UPDATE_TASK_ACTIVE_SQL,
+            [(1 if is_active else 0, task_id) for (task_id, is_active) in changes],
+        )
+    get_tasks_cached.clear()
 
 
 # ===== メイン処理 =====
+def flush_pending_points(conn):
+    pending = st.session_state.get("pending_points")
+    if pending:
+        log_points_many(conn, pending)
+        st.session_state["pending_points"] = []
+
+
+def set_hist_page(hist_page: int):
+    st.session_state["hist_page"] = hist_page
+
+
+@st.fragment
+def earn_points_fragment(conn, read_conn):
+    # タスク選択や「あとでまとめて追加」ではこの部分だけ再実行する
+    tasks = get_tasks_cached(read_conn, only_active=True)
+    if not tasks:
+        st.info("アクティブなタスクがありません。「タスク設定」から追加してください。")
+    else:
+        # タスク名 → (id, ポイント)。同名タスクは先に登録された方を使う
+        tasks_by_name = {}
+        for task_id, name, point_value in tasks:
+            tasks_by_name.setdefault(name, (task_id, point_value))
+        task_choice = st.selectbox("どの項目でポイントを貯める？", list(tasks_by_name))
+
+        # 選ばれたタスクのデフォルトポイント
+        default_point = tasks_by_name[task_choice][1]
+
+        points = st.number_input(
+            "今回貯めるポイント", min_value=1, step=1, value=default_point
+        )
+        note = st.text_input("メモ（任意：どんな行動をしたかなど）")
+
+        if st.button("ポイントを追加"):
+            log_points(conn, "earn", task_choice, int(points), note)
+            st.success(f"{points} pt を追加しました！")
+            # 残高表示はフラグメントの外なので、ページ全体を再実行する
+            st.rerun()
+
+        # 連続で記録するときは、いったん貯めておいて 1 回で保存する
+        # 日時はクリックした時点のものを持っておく（保存時の日時にしない）
+        if st.button("あとでまとめて追加"):
+            now_jst = datetime.now(JST).isoformat(timespec="seconds")
+            st.session_state.setdefault("pending_points", []).append(
+                ("earn", task_choice, int(points), note, now_jst)
+            )
+
+        pending = st.session_state.get("pending_points", [])
+        if pending:
+            pending_total = sum(p[2] for p in pending)
+            st.warning(
+                f"未保存: {len(pending)} 件（合計 {pending_total} pt）。"
+                "「まとめて保存」するか別のページに移るまで保存されません。"
+                "このままタブを閉じると消えてしまいます。"
+            )
+            if st.button("まとめて保存"):
+                flush_pending_points(conn)
+                st.success(f"{pending_total} pt をまとめて追加しました！")
+                st.rerun()
+
+
+@st.fragment
+def recent_diaries_fragment(read_conn):
+    # 「本文を表示」の切り替えではこの部分だけ再実行する
+    diaries = get_recent_diaries_cached(read_conn, limit=10)
+
+    if not diaries:
+        st.info("まだ日記がありません。「今日の日記を書く」から始めてみよう。")
+    else:
+        for row in diaries:
+            with st.expander(row["title"]):
+                # 本文は長くなりがちなので、表示するときだけ読み込む
+                # snippet が NULL（未設定）のときは本文ありとして扱う
+                if row["snippet"] == "":
+                    st.write("（本文なし）")
+                elif st.checkbox("本文を表示", key=f"show_diary_{row['id']}"):
+                    st.write(get_diary_content(read_conn, row["id"]))
+                st.caption(f"保存日時: {row['created_at']}")
+
+
+@st.fragment
+def points_history_fragment(read_conn):
+    # ページ送りではこの部分だけ再実行する
+    # 全件は読まず、1 ページ分だけ取ってくる
+    # （次のページがあるか判定するため 1 件多めに取る）
+    hist_page = st.session_state.get("hist_page", 0)
+    history = get_points_history(
+        read_conn, limit=HISTORY_PAGE_SIZE + 1, offset=hist_page * HISTORY_PAGE_SIZE
+    )
+    has_next = len(history) > HISTORY_PAGE_SIZE
+    history = history[:HISTORY_PAGE_SIZE]
+
+    if not history:
+        st.info("まだポイント履歴がありません。")
+    else:
+        # 表示用に加工（行ごとの dict ではなく、列ごとのリストで組み立てる）
+        # 履歴は新しい順なので、表示用残高は計算だけにする or 別にする
+        # ここではシンプルに「プラス / マイナス」だけ表示
+        st.dataframe(
+            {
+                "日時": [r["created_at"] for r in history],
+                "種類": [
+                    "貯めた" if r["action_type"] == "earn" else "使った"
+                    for r in history
+                ],
+                "項目 / 理由": [r["task_or_reason"] for r in history],
+                "ポイント": [r["points"] for r in history],
+                "メモ": [r["note"] or "" for r in history],
+            },
+            use_container_width=True,
+        )
+
+    # ページ番号はクリック時のコールバックで更新する（再実行はフラグメント内だけ）
+    col_prev, col_next = st.columns(2)
+    with col_prev:
+        if hist_page > 0:
+            st.button("前のページ", on_click=set_hist_page, args=(hist_page - 1,))
+    with col_next:
+        if has_next:
+            st.button("次のページ", on_click=set_hist_page, args=(hist_page + 1,))
+
+
 def main():
     st.set_page_config(page_title="日記 & ごほうびポイント", layout="wide")
 
+    # 書き込みは conn、読み取りは read_conn を使う
     conn = get_connection()
-    init_db(conn)
+    read_conn = get_read_connection()
 
     # ---- サイドバー ----
     st.sidebar.title("メニュー")
@@ -249,8 +547,12 @@ def main():
         ),
     )
 
+    # 「まとめて追加」で貯めていた分は、別ページに移ったら保存しておく
+    if page != "ポイントを貯める":
+        flush_pending_points(conn)
+
     # 共通で残高を出しておく
-    total_points = get_total_points(conn)
+    total_points = get_total_points_cached(read_conn)
 
     # ===== 1) 今日の日記を書く =====
     if page == "今日の日記を書く":
@@ -279,26 +581,7 @@ def main():
         st.header("🌱 ポイントを貯める")
         st.metric("現在のポイント残高", f"{total_points} pt")
 
-        tasks = get_active_tasks(conn)
-        if not tasks:
-            st.info("アクティブなタスクがありません。「タスク設定」から追加してください。")
-        else:
-            task_names = [t[1] for t in tasks]
-            task_choice = st.selectbox("どの項目でポイントを貯める？", task_names)
-
-            # 選ばれたタスクのデフォルトポイント
-            selected_task = next(t for t in tasks if t[1] == task_choice)
-            default_point = selected_task[2]
-
-            points = st.number_input(
-                "今回貯めるポイント", min_value=1, step=1, value=default_point
-            )
-            note = st.text_input("メモ（任意：どんな行動をしたかなど）")
-
-            if st.button("ポイントを追加"):
-                log_points(conn, "earn", task_choice, int(points), note)
-                st.success(f"{points} pt を追加しました！")
-                st.experimental_rerun()
+        earn_points_fragment(conn, read_conn)
 
     # ===== 3) ポイントを使う =====
     elif page == "ポイントを使う":
@@ -318,7 +601,7 @@ def main():
                 label = reason.strip() or "理由なし"
                 log_points(conn, "spend", label, -int(use_points), note)
                 st.success(f"{use_points} pt を消費しました！（ご褒美：{label}）")
-                st.experimental_rerun()
+                st.rerun()
 
     # ===== 4) 履歴・合計ポイントを見る =====
     elif page == "履歴・合計ポイントを見る":
@@ -328,65 +611,11 @@ def main():
 
         # ---- 最近の日記（直近 10 件） ----
         st.subheader("📝 最近の日記（直近10件）")
-        diaries = get_recent_diaries(conn, limit=10)
-
-        if not diaries:
-            st.info("まだ日記がありません。「今日の日記を書く」から始めてみよう。")
-        else:
-            for entry_date, entry_time, mood_text, content, created_at in diaries:
-                # 時刻ラベル
-                if entry_time:
-                    time_label = entry_time[:5]  # "HH:MM:SS" → "HH:MM"
-                else:
-                    time_label = created_at[11:16] if created_at else ""
-
-                # 気分ラベル（絵文字付き）
-                emoji = MOOD_TO_EMOJI.get(mood_text, "")
-                if mood_text == "なし":
-                    mood_label = f"{emoji} 気分記録なし"
-                else:
-                    mood_label = f"{emoji} {mood_text}"
-
-                # 本文先頭 20 文字をタイトルに入れる
-                snippet_source = (content or "").replace("\n", " ").strip()
-                snippet = snippet_source[:20]
-
-                title = f"{entry_date} {time_label} | {mood_label}"
-                if snippet:
-                    title += f" | {snippet}"
-
-                with st.expander(title):
-                    st.write(content if content else "（本文なし）")
-                    st.caption(f"保存日時: {created_at}")
+        recent_diaries_fragment(read_conn)
 
         # ---- ポイント履歴 ----
         st.subheader("📚 ポイント履歴")
-        history = get_points_history(conn)
-
-        if not history:
-            st.info("まだポイント履歴がありません。")
-        else:
-            # 表示用に加工
-            rows = []
-            running_total = 0
-            # 履歴は新しい順なので、表示用残高は計算だけにする or 別にする
-            # ここではシンプルに「プラス / マイナス」だけ表示
-            for action_type, task_or_reason, points, note, created_at in history:
-                kind = "貯めた" if action_type == "earn" else "使った"
-                rows.append(
-                    {
-                        "日時": created_at,
-                        "種類": kind,
-                        "項目 / 理由": task_or_reason,
-                        "ポイント": points,
-                        "メモ": note or "",
-                    }
-                )
-
-            import pandas as pd  # Streamlit には同梱されているので requirements 追加は不要
-
-            df = pd.DataFrame(rows)
-            st.dataframe(df, use_container_width=True)
+        points_history_fragment(read_conn)
 
     # ===== 5) タスク設定 =====
     elif page == "タスク設定":
@@ -395,24 +624,36 @@ def main():
         st.write("ポイントを貯めるときに選べる『タスク』を管理します。")
 
         # 既存タスク一覧
-        all_tasks = get_all_tasks(conn)
+        all_tasks = get_tasks_cached(read_conn, only_active=False)
         if not all_tasks:
             st.info("まだタスクがありません。下のフォームから追加してください。")
         else:
             st.subheader("現在のタスク一覧")
-            for task_id, name, point_value, is_active in all_tasks:
-                col1, col2, col3 = st.columns([4, 2, 2])
-                with col1:
-                    st.write(name)
-                with col2:
-                    st.write(f"{point_value} pt")
-                with col3:
-                    active_label = "✅ 有効" if is_active else "⛔ 無効"
-                    if st.button(
-                        active_label + f"（切り替え）", key=f"toggle_{task_id}"
-                    ):
-                        update_task_active(conn, task_id, not bool(is_active))
-                        st.experimental_rerun()
+            # 有効 / 無効はまとめて切り替えて、保存ボタンで 1 回だけ書き込む
+            with st.form("task_active_form"):
+                new_states = []
+                for task_id, name, point_value, is_active in all_tasks:
+                    col1, col2, col3 = st.columns([4, 2, 2])
+                    with col1:
+                        st.write(name)
+                    with col2:
+                        st.write(f"{point_value} pt")
+                    with col3:
+                        checked = st.checkbox(
+                            "有効", value=bool(is_active), key=f"active_{task_id}"
+                        )
+                    new_states.append((task_id, bool(is_active), checked))
+
+                if st.form_submit_button("有効 / 無効を保存"):
+                    changes = [
+                        (task_id, checked)
+                        for (task_id, was_active, checked) in new_states
+                        if checked != was_active
+                    ]
+                    if changes:
+                        update_tasks_active(conn, changes)
+                        st.success(f"{len(changes)} 件のタスクを更新しました！")
+                        st.rerun()
 
         st.subheader("タスクを追加する")
         new_name = st.text_input("タスク名（例：勉強1時間、掃除30分 など）")
@@ -426,7 +667,7 @@ def main():
             else:
                 add_task(conn, new_name.strip(), int(new_point))
                 st.success("タスクを追加しました！")
-                st.experimental_rerun()
+                st.rerun()
 
 
 if __name__ == "__main__":